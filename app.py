@@ -1,16 +1,19 @@
 import streamlit as st
 import os
 import datetime
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
 from src.models import StudentSession, TestResult, TagInstance
-from src.utils import PARTS, PASSAGGIO_CRITERIA, TESTS
-from src.audio_processor import AudioProcessor
-from src.pdf_generator import PDFGenerator
+from src.utils import PARTS, PASSAGGIO_CRITERIA, TESTS, DIAGNOSIS_RULES, DIAGNOSIS_DEFAULT, TARGET_NOTES, TARGET_HZ
 
 # Constants
 RECORDINGS_DIR = "recordings"
 REPORTS_DIR = "reports"
+MAX_TRACK_POINTS = 512 # Stored pitch/energy track length (plots only)
+COPY_BUFSIZE = 1 << 20 # 1 MiB chunks when writing uploads to disk
+VIDEO_COPY_BUFSIZE = 4 << 20 # 4 MiB for video uploads
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
@@ -20,82 +23,215 @@ if 'session' not in st.session_state:
 if 'current_test_index' not in st.session_state:
     st.session_state['current_test_index'] = 0
 
+@st.cache_resource
+def start_analysis_warmup():
+    """
+    Imports the analysis stack (librosa, and the Numba kernels' import-time JIT warmup) on a
+    background thread, once per server process: the first page render doesn't wait for it,
+    and by the first analysis it has usually finished.
+    """
+    import importlib
+    import threading
+    # Plain module import, no st.* calls: an import racing get_processor() just waits on
+    # Python's import lock instead of importing twice.
+    thread = threading.Thread(target=importlib.import_module, args=("src.audio_processor",), daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def get_processor():
+    """Shared AudioProcessor, built once per server process instead of per rerun."""
+    from src.audio_processor import AudioProcessor # usually already imported by start_analysis_warmup
+    return AudioProcessor(pitch_backend="pyworld")
+
+@st.cache_resource
+def get_pdf_generator():
+    """Shared PDFGenerator (stylesheet + font setup only happens once)."""
+    from src.pdf_generator import PDFGenerator # reportlab/matplotlib only needed for the report
+    return PDFGenerator()
+
+@st.cache_data(ttl=3600)
+def list_installed_packages():
+    """pip-freeze style listing via importlib.metadata (no subprocess fork per rerun)."""
+    import importlib.metadata
+    lines = {f"{d.metadata['Name']}=={d.version}" for d in importlib.metadata.distributions()}
+    return "\n".join(sorted(lines, key=str.lower))
+
+@st.cache_data(show_spinner=False)
+def reference_tone_bytes(target_hz: float) -> bytes:
+    """2 seconds of normalized piano tone at target_hz, as WAV bytes."""
+    import io
+    import soundfile as sf
+    from src.synth import generate_piano_note
+    
+    waveform = generate_piano_note(target_hz, duration=2.0)
+    peak = np.max(np.abs(waveform))
+    if peak > 0:
+        waveform = waveform / peak
+    
+    buf = io.BytesIO()
+    sf.write(buf, waveform, 44100, format='WAV', subtype='PCM_16')
+    return buf.getvalue()
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def parse_midi_cached(midi_digest, _midi_file):
+    """Parsed (tracks, PrettyMIDI) per uploaded file, so widget reruns don't re-parse the MIDI."""
+    from src.midi_handler import get_midi_tracks
+    # Read file pointer compatible with pretty_midi
+    # pretty_midi expects file path or file-like object
+    _midi_file.seek(0)
+    return get_midi_tracks(_midi_file)
+
+@st.cache_data(show_spinner=False)
+def synthesize_midi_part(midi_digest, _midi_data, track_index):
+    """WAV bytes for one MIDI track, cached on (file digest, track) so re-clicks are instant."""
+    from src.midi_handler import synthesis_midi_track
+    buf = synthesis_midi_track(_midi_data, track_index)
+    return buf.getvalue() if buf else None
+
+@st.cache_resource
+def probe_video_libs():
+    """MediaPipe/OpenCV versions (None if missing). Imported once, not on every debug rerun."""
+    libs = {"mediapipe": None, "mediapipe_solutions": False, "cv2": None}
+    try:
+        import mediapipe as mp
+        libs["mediapipe"] = mp.__version__
+        libs["mediapipe_solutions"] = hasattr(mp, 'solutions')
+    except ImportError:
+        pass
+    try:
+        import cv2
+        libs["cv2"] = cv2.__version__
+    except ImportError:
+        pass
+    return libs
+
 def save_uploaded_file(uploaded_file, test_id):
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{st.session_state['session'].id}_{test_id}_{timestamp}.wav"
+    """
+    Saves the upload under a content-addressed name and returns (filepath, digest).
+    Identical uploads map to the same file (and the same analysis cache entry) and are not rewritten.
+    """
+    # getbuffer() is a zero-copy view of the upload
+    digest = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=8).hexdigest()
+    filename = f"{st.session_state['session'].id}_{test_id}_{digest}.wav"
     filepath = os.path.join(RECORDINGS_DIR, filename)
-    with open(filepath, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return filepath
+    if not os.path.exists(filepath):
+        # Stream in 1 MiB chunks instead of materializing the whole file
+        uploaded_file.seek(0)
+        with open(filepath, "wb", buffering=COPY_BUFSIZE) as f:
+            shutil.copyfileobj(uploaded_file, f, COPY_BUFSIZE)
+    return filepath, digest
+
+@st.cache_data(show_spinner=False)
+def extract_features_cached(audio_digest, voice_part, _filepath):
+    """
+    Decodes audio and extracts (times, f0, rms, voiced_probs, silent) with the part's F0
+    search range; silent is True when the silence gate skipped pitch tracking.
+    Keyed on the content digest + part only, so re-analyzing identical audio skips pYIN entirely.
+    """
+    processor = get_processor()
+    y, sr = processor.load_audio(_filepath)
+    return (*processor.extract_features(y, voice_part), processor.is_silent(y))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def analyze_video_cached(video_digest, rotate, _video_file):
+    """
+    MediaPipe Face Mesh pass over an uploaded clip -> (DataFrame, max_frame_rgb).
+    Keyed on the content digest + rotation, so re-analyzing the same clip is free and
+    toggling rotation only reprocesses once per orientation.
+    """
+    import tempfile
+    from src.video_processor import VideoProcessor
+    # Create temp file, write, and CLOSE it so other libs can read it
+    # (streamed in VIDEO_COPY_BUFSIZE chunks; phone clips can be 100+ MB)
+    tfile = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4', buffering=VIDEO_COPY_BUFSIZE)
+    _video_file.seek(0)
+    shutil.copyfileobj(_video_file, tfile, VIDEO_COPY_BUFSIZE)
+    tfile.close() # Critical: Close before OpenCV opens it
+    try:
+        vp = VideoProcessor()
+        return vp.process_video(tfile.name, rotate=rotate)
+    finally:
+        os.unlink(tfile.name)
+
+@st.cache_data(show_spinner=False)
+def build_track_frames(times, pitch, energy, voiced_mask):
+    """
+    DataFrames for st.line_chart (rendered client-side), cached on the stored track values.
+    Returns (pitch_df over voiced frames only, energy_df).
+    """
+    import pandas as pd # only needed once a result is displayed
+    pitch_df = pd.DataFrame({"Pitch (Hz)": pitch[voiced_mask]}, index=times[voiced_mask])
+    energy_df = pd.DataFrame({"Energy (RMS)": energy}, index=times)
+    return pitch_df, energy_df
+
+_RULE_ATTRS = [rule[0] for rule in DIAGNOSIS_RULES]
+_RULE_LO = np.array([rule[1] for rule in DIAGNOSIS_RULES])
+_RULE_HI = np.array([rule[2] for rule in DIAGNOSIS_RULES])
+
+def generate_diagnoses_batch(results):
+    """Evaluates DIAGNOSIS_RULES for all results at once; returns one diagnosis text per result."""
+    if not results:
+        return []
+    # (n_results, n_rules) matrix of the metric each rule looks at
+    values = np.array([[getattr(r, attr) for attr in _RULE_ATTRS] for r in results], dtype=float)
+    hits = (values >= _RULE_LO) & (values < _RULE_HI)
+
+    texts = []
+    for row_values, row_hits in zip(values, hits):
+        diagnosis = [DIAGNOSIS_RULES[j][3].format(value=row_values[j]) for j in np.flatnonzero(row_hits)]
+        texts.append(" ".join(diagnosis) if diagnosis else DIAGNOSIS_DEFAULT)
+    return texts
 
 def generate_diagnosis(result, part):
     """Generates meaningful diagnostic text based on metrics."""
-    diagnosis = []
-    
-    # Accuracy
-    if result.pitch_accuracy_cents >= 900.0:
-        diagnosis.append("음정이 감지되지 않았거나 분석에 실패했습니다. (소음/무음)")
-    elif result.pitch_accuracy_cents > 50:
-        diagnosis.append(f"피치가 목표음보다 평균 {result.pitch_accuracy_cents:.1f} cents 벗어났습니다. (정확도 주의)")
-    elif result.pitch_accuracy_cents < 20:
-        diagnosis.append("피치 정확도가 매우 우수합니다.")
-
-    # Stability
-    if result.pitch_stability_cents >= 900.0:
-        pass # Already handled by accuracy failure message
-    elif result.pitch_stability_cents > 30:
-        diagnosis.append("음의 흔들림(Vibrato/Tremolo)이 다소 큽니다. 호흡 지탱을 확인하세요.")
-    elif result.pitch_stability_cents < 10 and result.pitch_stability_cents >= 0:
-        diagnosis.append("음이 매우 안정적입니다 (Straight Tone).")
-
-    # Drift
-    if result.pitch_drift_cents < -20:
-        diagnosis.append("끝음이 처지는 경향(Flat Drift)이 있습니다.")
-    elif result.pitch_drift_cents > 20:
-        diagnosis.append("끝음이 샵되는 경향(Sharp Drift)이 있습니다.")
-
-    # Voiced Ratio
-    # We need to add voiced_ratio to TestResult model first, or just use it here if returned
-    # Assuming result object has it or we add it to the model.
-    # For now, simplistic check if accuracy is 0 (which might imply no voiced frames found)
-    
-    # New Strict Check: On-Target Ratio
-    if result.pitch_on_target_ratio < 0.6:
-        diagnosis.append("음정이 불안정하여 목표음을 많이 벗어납니다. (정확도 < 60%)")
-    elif result.pitch_on_target_ratio < 0.85:
-        diagnosis.append("중간중간 음정이 흔들립니다. 호흡 지탱에 신경쓰세요.")
-    
-    if not diagnosis:
-        diagnosis.append("전반적으로 안정적인 발성입니다. 세부 지표인 비브라토 속도 등을 체크해보세요.")
+    return generate_diagnoses_batch([result])[0]
 
-    return " ".join(diagnosis)
+def target_note_for(test_name, part):
+    """Sustained tests are scored against the part's target note; other tests have none."""
+    if "Sustained" in test_name:
+        return TARGET_NOTES.get(part, "C4")
+    return None
 
-def analyze_audio(filepath, test_id, target_note=None, voice_part="Soprano"):
-    processor = AudioProcessor()
-    y, sr = processor.load_audio(filepath)
-    times, f0, rms, voiced_probs = processor.extract_features(y)
+def run_analysis(filepath, audio_digest, target_note=None, voice_part="Soprano"):
+    """
+    Feature extraction + metrics for one recording, with no Streamlit UI or session state,
+    so it can run on worker threads. Returns (times, f0, rms, voiced_mask, duration_s, metrics)
+    with the tracks already decimated for storage.
+    """
+    processor = get_processor()
+    times, f0, rms, voiced_probs, silent = extract_features_cached(audio_digest, voice_part, filepath)
+    voiced_mask = processor.voiced_mask(f0)
     
     # Calculate Metrics with new strict logic
     metrics = processor.calculate_metrics(f0, rms, voiced_probs, target_note, voice_part)
+    metrics["silent"] = silent
     
-    # Validation for Test 6 (After) vs Test 1 (Before)
-    if test_id == "T6":
-         t1_result = st.session_state['session'].get_result("T1")
-         if t1_result:
-             # Check duration similarity? 
-             duration = times[-1] if len(times) > 0 else 0
-             t1_duration = t1_result.pitch_track_time[-1] if t1_result.pitch_track_time else 0
-             if abs(duration - t1_duration) > 2.0:
-                 st.warning(f"⚠️ Warning: Test 6 duration ({duration:.1f}s) differs significantly from Test 1 ({t1_duration:.1f}s). Comparability may be low.")
+    duration_s = float(times[-1]) if len(times) > 0 else 0.0
+
+    # Metrics use the full-resolution tracks; what we keep on the result is only for plotting,
+    # so decimate to a plot-friendly size to keep session state small across reruns.
+    stride = max(1, len(times) // MAX_TRACK_POINTS)
+    times = np.ascontiguousarray(times[::stride], dtype=np.float32)
+    f0 = np.ascontiguousarray(f0[::stride], dtype=np.float32)
+    rms = np.ascontiguousarray(rms[::stride], dtype=np.float32)
+    voiced_mask = voiced_mask[::stride].copy()
+    return times, f0, rms, voiced_mask, duration_s, metrics
 
+def build_result(test_id, test_name, filepath, audio_digest, analysis, voice_part):
+    """Wraps run_analysis() output in a TestResult with its diagnosis tag."""
+    times, f0, rms, voiced_mask, duration_s, metrics = analysis
     result = TestResult(
         test_id=test_id,
-        test_name=TESTS[st.session_state['current_test_index']]['name'],
+        test_name=test_name,
         audio_file_path=filepath,
-        pitch_track_time=times.tolist(),
-        pitch_track_hz=f0.tolist(), # Contains nans now
-        energy_track_time=times.tolist(),
-        energy_track_rms=rms.tolist(),
+        audio_digest=audio_digest,
+        pitch_track_time=times,
+        pitch_track_hz=f0, # Contains nans now
+        energy_track_time=times,
+        energy_track_rms=rms,
+        voiced_mask=voiced_mask,
+        duration_s=duration_s,
         pitch_accuracy_cents=metrics['accuracy'],
         pitch_stability_cents=metrics['stability'],
         pitch_drift_cents=metrics['drift'],
@@ -110,9 +246,85 @@ def analyze_audio(filepath, test_id, target_note=None, voice_part="Soprano"):
     
     return result
 
+def analyze_audio(filepath, audio_digest, test_id, target_note=None, voice_part="Soprano"):
+    analysis = run_analysis(filepath, audio_digest, target_note, voice_part)
+    duration_s, metrics = analysis[4], analysis[5]
+    
+    if metrics['silent']:
+        st.warning("🔇 녹음에서 목소리가 감지되지 않았습니다. 마이크를 확인하고 다시 녹음해 주세요.")
+    elif metrics['voiced_ratio'] == 0.0:
+        # Audible take, but no confident pitch inside the part's range (wrong part selected?)
+        st.warning(f"🎚️ 선택한 파트({voice_part}) 음역에서 음정이 검출되지 않았습니다. 파트 설정을 확인해 주세요.")
+    
+    # Validation for Test 6 (After) vs Test 1 (Before)
+    if test_id == "T6":
+         t1_result = st.session_state['session'].get_result("T1")
+         if t1_result:
+             # Check duration similarity? 
+             if abs(duration_s - t1_result.duration_s) > 2.0:
+                 st.warning(f"⚠️ Warning: Test 6 duration ({duration_s:.1f}s) differs significantly from Test 1 ({t1_result.duration_s:.1f}s). Comparability may be low.")
+
+    test_name = TESTS[st.session_state['current_test_index']]['name']
+    return build_result(test_id, test_name, filepath, audio_digest, analysis, voice_part)
+
+def reanalyze_session(session):
+    """
+    Re-runs every stored audio analysis against the session's current part (e.g. after the
+    part was changed). Recordings are independent, so they run concurrently; pYIN's numpy
+    work releases the GIL, and the feature cache is shared across threads.
+    """
+    jobs = [r for r in session.results.values()
+            if r.audio_file_path and r.audio_digest and os.path.exists(r.audio_file_path)]
+    if not jobs:
+        return 0
+
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    part = session.part
+    get_processor()  # build the shared processor once, before the workers race for it
+    # Workers inherit this run's ScriptRunContext, so the cached feature lookups they make
+    # behave as on the main thread (no "missing ScriptRunContext" warnings)
+    with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1),
+                            initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())) as ex:
+        analyses = list(ex.map(
+            lambda r: run_analysis(r.audio_file_path, r.audio_digest, target_note_for(r.test_name, part), part),
+            jobs))
+
+    for r, analysis in zip(jobs, analyses):
+        session.add_result(build_result(r.test_id, r.test_name, r.audio_file_path, r.audio_digest, analysis, part))
+    return len(jobs)
+
+def render_result(test_id):
+    """Metrics, diagnosis and charts for a stored TestResult."""
+    result = st.session_state['session'].get_result(test_id)
+    if result is None:
+        return
+    
+    # Display Result
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Pitch Accuracy (Cents)", f"{result.pitch_accuracy_cents:.1f}", delta_color="inverse")
+    col2.metric("Stability (Std Dev)", f"{result.pitch_stability_cents:.1f}", delta_color="inverse")
+    col3.metric("Drift (Slope)", f"{result.pitch_drift_cents:.2f}")
+    
+    # Feedback based on On-Target Ratio
+    if result.pitch_on_target_ratio < 0.6:
+        st.warning(f"⚠️ **Unstable Pitch**: Only {result.pitch_on_target_ratio*100:.1f}% of frames were on target.")
+    else:
+        st.success(f"✅ **Stable Pitch**: {result.pitch_on_target_ratio*100:.1f}% on target.")
+
+    # Diagnosis List
+    st.write("### 🩺 Diagnosis")
+    for tag in result.tags:
+        st.write(f"- {tag.description}")
+    
+    # Graphs
+    pitch_df, energy_df = build_track_frames(result.pitch_track_time, result.pitch_track_hz, result.energy_track_rms, result.voiced_mask)
+    st.line_chart(pitch_df, x_label="Time (s)", y_label="Freq (Hz)")
+    st.line_chart(energy_df, x_label="Time (s)", y_label="Energy (RMS)")
+
 def main():
     st.set_page_config(page_title="Vocal Diagnostic Report", layout="wide")
     st.title("🎤 Vocal Diagnostic Report (VDR)")
+    start_analysis_warmup()
 
     # Sidebar
     with st.sidebar:
@@ -146,35 +358,33 @@ def main():
         st.session_state['session'].passaggio_info = PASSAGGIO_CRITERIA[st.session_state['session'].part]
         st.info(f"Passaggio: {st.session_state['session'].passaggio_info['desc']}")
         
-        # Debug Info
-        with st.expander("🛠️ Debug Info (Show to Developer)", expanded=True):
-            import sys
-            import subprocess
+        # Debug Info (developer-only: open the app with ?debug=1)
+        if st.query_params.get("debug") == "1":
+            with st.expander("🛠️ Debug Info (Show to Developer)", expanded=False):
+                import sys
             
-            st.code(f"Python: {sys.version.split()[0]}")
+                st.code(f"Python: {sys.version.split()[0]}")
             
-            # Show pip freeze to debug installation
-            try:
-                result = subprocess.run([sys.executable, '-m', 'pip', 'freeze'], capture_output=True, text=True)
-                installed_packages = result.stdout
-                st.text("Installed Packages:")
-                st.code(installed_packages, language="text", line_numbers=True)
-            except Exception as e:
-                st.error(f"Failed to list packages: {e}")
+                # Show installed packages to debug installation
+                try:
+                    installed_packages = list_installed_packages()
+                    st.text("Installed Packages:")
+                    st.code(installed_packages, language="text", line_numbers=True)
+                except Exception as e:
+                    st.error(f"Failed to list packages: {e}")
 
-            # Specific Checks
-            try:
-                import mediapipe as mp
-                st.success(f"MediaPipe: {mp.__version__}")
-                st.write(f"Has solutions? {'✅' if hasattr(mp, 'solutions') else '❌'}")
-            except ImportError:
-                st.error("MediaPipe: Not Installed")
+                # Specific Checks
+                libs = probe_video_libs()
+                if libs["mediapipe"]:
+                    st.success(f"MediaPipe: {libs['mediapipe']}")
+                    st.write(f"Has solutions? {'✅' if libs['mediapipe_solutions'] else '❌'}")
+                else:
+                    st.error("MediaPipe: Not Installed")
                 
-            try:
-                import cv2
-                st.success(f"OpenCV: {cv2.__version__}")
-            except ImportError:
-                st.error("OpenCV: Not Installed")
+                if libs["cv2"]:
+                    st.success(f"OpenCV: {libs['cv2']}")
+                else:
+                    st.error("OpenCV: Not Installed")
         
         st.markdown("---")
         
@@ -183,10 +393,8 @@ def main():
         midi_file = st.file_uploader("Upload MIDI File", type=["mid", "midi"])
         
         if midi_file:
-            from src.midi_handler import get_midi_tracks, synthesis_midi_track
-            # Read file pointer compatible with pretty_midi
-            # pretty_midi expects file path or file-like object
-            tracks, midi_data = get_midi_tracks(midi_file)
+            midi_digest = hashlib.blake2b(midi_file.getbuffer(), digest_size=8).hexdigest()
+            tracks, midi_data = parse_midi_cached(midi_digest, midi_file)
             
             if tracks:
                 track_names = [f"{t['index']}: {t['name']}" for t in tracks]
@@ -195,7 +403,7 @@ def main():
                 
                 if st.button("Generate & Play Part"):
                     with st.spinner("Synthesizing Audio..."):
-                        wav_bytes = synthesis_midi_track(midi_data, selected_index)
+                        wav_bytes = synthesize_midi_part(midi_digest, midi_data, selected_index)
                         if wav_bytes:
                             st.audio(wav_bytes, format='audio/wav')
                         else:
@@ -205,6 +413,11 @@ def main():
         
         st.markdown("---")
 
+        if st.session_state['session'].results and st.button("🔁 Re-run All Analyses"):
+            with st.spinner("Re-analyzing recordings..."):
+                n = reanalyze_session(st.session_state['session'])
+            st.success(f"{n} recording(s) re-analyzed for {st.session_state['session'].part}.")
+
         if st.button("Reset Session"):
             st.session_state['session'] = StudentSession()
             st.session_state['current_test_index'] = 0
@@ -225,41 +438,16 @@ def main():
         st.markdown(f"**Instructions**: {test['description']}")
         
         # Display Target Note for Sustained Tests
-        if "Sustained" in test['name']:
-            target_map = {
-                "Soprano": "F5 (698 Hz)", 
-                "Alto": "E5 (659 Hz)", 
-                "Tenor": "F4 (349 Hz)", 
-                "Baritone": "E4 (330 Hz)", 
-                "Bass": "Eb4 (311 Hz)"
-            }
-            target_note = target_map.get(st.session_state['session'].part, "C4").split(" ")[0] # Extract "F4" from "F4 (349 Hz)"
-            st.info(f"🎵 **Target Note (Passaggio Start)**: {target_map.get(st.session_state['session'].part)}")
+        target_note = target_note_for(test['name'], st.session_state['session'].part)
+        if target_note:
+            part = st.session_state['session'].part
+            target_hz = TARGET_HZ.get(part, 261.63)
+            st.info(f"🎵 **Target Note (Passaggio Start)**: {target_note} ({target_hz:.0f} Hz)")
             
             # Play Reference Pitch
             try:
-                # Extract Hz from string "F4 (349 Hz)" -> 349
-                target_str = target_map.get(st.session_state['session'].part, "C4 (261 Hz)")
-                hz_str = target_str.split("(")[1].split(" ")[0]
-                target_hz = float(hz_str)
-                
-                # Use Piano Synth for Reference Pitch
-                from src.synth import generate_piano_note
-                import soundfile as sf
-                import io
-                import numpy as np
-                
-                # Generate 2 seconds of Piano C4/F4/etc
-                waveform = generate_piano_note(target_hz, duration=2.0)
-                # Normalize
-                waveform = waveform / np.max(np.abs(waveform)) if np.max(np.abs(waveform)) > 0 else waveform
-                
-                buf = io.BytesIO()
-                sf.write(buf, waveform, 44100, format='WAV', subtype='PCM_16')
-                buf.seek(0) 
-                tone_bytes = buf
-                
-                st.audio(tone_bytes, format='audio/wav', start_time=0)
+                # Use Piano Synth for Reference Pitch (synthesized once per pitch, then served from cache)
+                st.audio(reference_tone_bytes(target_hz), format='audio/wav', start_time=0)
                 st.caption("🎹 Play Reference Pitch (Piano)")
             except Exception as e:
                 st.warning(f"Audio Playback Error: {e}")
@@ -273,47 +461,15 @@ def main():
             st.audio(audio_value, format='audio/wav')
             
             with st.spinner("Analyzing..."):
-                # Save to temp file
-                import tempfile
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-                    tmp_file.write(audio_value.read())
-                    tmp_path = tmp_file.name
+                # Save to recordings/ (also yields the content digest used as cache key)
+                filepath, audio_digest = save_uploaded_file(audio_value, test['id'])
                 
-                # Analyze
-                from src.audio_processor import AudioProcessor
-                processor = AudioProcessor()
-                y, sr = processor.load_audio(tmp_path)
-                metrics = processor.calculate_metrics(y, sr, target_note=test.get('target_note'))
+                # Analyze (decode + pitch tracking are served from cache for identical audio)
+                result = analyze_audio(filepath, audio_digest, test['id'], target_note, st.session_state['session'].part)
+                st.session_state['session'].add_result(result)
                 
-                st.success("Analysis Complete!")
-                
-                # Diagnosis
-                diagnosis = generate_diagnosis(metrics, test['name'])
-                st.session_state['session'].add_result(
-                    test_name=test['name'],
-                    metrics=metrics,
-                    diagnosis=diagnosis
-                )
-                
-                # Display Result
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Pitch Accuracy (Cents)", f"{metrics['accuracy']:.1f}", delta_color="inverse")
-                col2.metric("Stability (Std Dev)", f"{metrics['stability']:.1f}", delta_color="inverse")
-                col3.metric("Drift (Slope)", f"{metrics['drift']:.2f}")
-                
-                 # Feedback based on On-Target Ratio
-                if metrics['on_target_ratio'] < 0.6:
-                    st.warning(f"⚠️ **Unstable Pitch**: Only {metrics['on_target_ratio']*100:.1f}% of frames were on target.")
-                else:
-                    st.success(f"✅ **Stable Pitch**: {metrics['on_target_ratio']*100:.1f}% on target.")
-
-                # Diagnosis List
-                st.write("### 🩺 Diagnosis")
-                for item in diagnosis:
-                    st.write(f"- {item}")
-                
-                # Graphs
-                st.plotly_chart(generate_pitch_plot(y, sr, metrics['mean_pitch_hz']), use_container_width=True)
+            st.success("Analysis Complete!")
+            render_result(test['id'])
 
     with tab2:
         st.markdown("### 📹 Facial Tension Analysis")
@@ -347,20 +503,11 @@ def main():
             if st.button("Analyze Face Tension"):
                 with st.spinner("Processing Video (MediaPipe Face Mesh)..."):
                     try:
-                        import tempfile
-                        # Create temp file, write, and CLOSE it so other libs can read it
-                        tfile = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') 
-                        tfile.write(video_file.read())
-                        tfile.close() # Critical: Close before OpenCV opens it
-                        
                         from src.video_processor import VideoProcessor
-                        vp = VideoProcessor()
+                        video_digest = hashlib.blake2b(video_file.getbuffer(), digest_size=8).hexdigest()
                         
                         # Pass rotation flag
-                        df, max_frame = vp.process_video(tfile.name, rotate=rotate_video)
-                        
-                        # Cleanup
-                        os.unlink(tfile.name)
+                        df, max_frame = analyze_video_cached(video_digest, rotate_video, video_file)
                         
                         if df is not None and not df.empty:
                             st.success("분석 완료! (Analysis Complete)")
@@ -371,7 +518,7 @@ def main():
                                 st.image(max_frame, caption="가장 입을 크게 벌린 순간", use_container_width=True)
                             
                             # Show Chart
-                            fig = vp.generate_tension_chart(df)
+                            fig = VideoProcessor.generate_tension_chart(df)
                             st.plotly_chart(fig, use_container_width=True)
                             
                             avg_openness = df['openness'].max() # Use MAX openness, not mean, as per user feedback ("I opened wide")
@@ -413,7 +560,7 @@ def main():
         
         if st.button("Generate PDF Report"):
             try:
-                gen = PDFGenerator()
+                gen = get_pdf_generator()
                 filename = f"VDR_Report_{st.session_state['session'].student_name}_{datetime.datetime.now().strftime('%Y%m%d')}.pdf"
                 filepath = os.path.join(REPORTS_DIR, filename)
                 gen.generate_report(st.session_state['session'], filepath)
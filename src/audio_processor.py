@@ -1,93 +1,209 @@
+import math
+import functools
 import librosa
 import numpy as np
+import scipy.signal
 import scipy.stats
+import soundfile as sf
 import scipy.io.wavfile as wavfile
 import io
 from typing import Tuple, List, Optional, Dict
-from src.utils import PASSAGGIO_CRITERIA
+from src.utils import VOICE_LIMITS_HZ, PRIMARY_PASSAGGIO_HZ
+from src.audio_processor_kernels import voiced_pitch_stats, suppress_octave_jumps
+
+try:
+    import pyworld  # Optional: DIO/StoneMask F0 backend (C implementation, much faster than pYIN)
+except ImportError:
+    pyworld = None
 
 def generate_tone(frequency: float, duration_sec: float = 2.0, sample_rate: int = 44100) -> io.BytesIO:
     """Generates a sine wave tone for the given frequency."""
-    t = np.linspace(0, duration_sec, int(sample_rate * duration_sec), endpoint=False)
-    # Generate sine wave
-    waveform = 0.5 * np.sin(2 * np.pi * frequency * t)
-    # Convert to 16-bit PCM
-    waveform_int16 = (waveform * 32767).astype(np.int16)
+    # Generate sine wave (same samples as linspace(..., endpoint=False) without the time grid).
+    # Phase is built and wrapped to one cycle in float64 before narrowing, as in synth.py,
+    # so the float32 sin keeps full phase precision over the whole tone.
+    cycles = np.arange(int(sample_rate * duration_sec)) * (frequency / sample_rate)
+    np.mod(cycles, 1.0, out=cycles)
+    waveform = (2 * np.pi * cycles).astype(np.float32)
+    np.sin(waveform, out=waveform)
+    # Convert to 16-bit PCM (0.5 amplitude)
+    waveform *= np.float32(0.5 * 32767)
+    waveform_int16 = waveform.astype(np.int16)
     
     buf = io.BytesIO()
     wavfile.write(buf, sample_rate, waveform_int16)
     buf.seek(0)
     return buf
 
+@functools.lru_cache(maxsize=128)
+def _note_hz(note: str) -> float:
+    """librosa.note_to_hz, memoized (it parses the note string on every call)."""
+    return float(librosa.note_to_hz(note))
+
+def _frame_rms(y: np.ndarray, frame_length: int = 2048, hop_length: int = 512) -> np.ndarray:
+    """
+    Same framing as librosa.feature.rms (centered, zero-padded), one value per hop.
+    Frames are strided views into the padded signal; only the squared-sum is materialized.
+    """
+    pad = frame_length // 2
+    y_pad = np.pad(np.asarray(y, dtype=np.float32), pad, mode='constant')
+    frames = np.lib.stride_tricks.sliding_window_view(y_pad, frame_length)[::hop_length]
+    return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frame_length)
+
+# Silence gates for extract_features (linear amplitude / dB below the loudest frame)
+SILENCE_PEAK = 0.01
+SILENCE_RMS = 1e-4
+SILENCE_TOP_DB = 40.0
+
+# Parts whose F0 search ceiling is below LOW_VOICE_FMAX (Tenor/Baritone/Bass) are pitch-tracked
+# at sr / PITCH_DECIMATION (11025 Hz by default); Soprano/Alto keep the full rate.
+LOW_VOICE_FMAX = 600.0
+PITCH_DECIMATION = 2
+
 class AudioProcessor:
-    def __init__(self, sample_rate: int = 22050):
+    def __init__(self, sample_rate: int = 22050, pitch_backend: str = "pyin"):
         self.sr = sample_rate
+        # "pyin" (librosa) or "pyworld". Falls back to pYIN if pyworld is not installed.
+        if pitch_backend == "pyworld" and pyworld is None:
+            pitch_backend = "pyin"
+        self.pitch_backend = pitch_backend
 
     def load_audio(self, file_path: str) -> Tuple[np.ndarray, int]:
-        """Loads audio file."""
+        """
+        Loads audio file as mono float32 at self.sr.
+        Decodes with soundfile and resamples with a polyphase filter (much cheaper than librosa.load).
+        """
         try:
-            y, sr = librosa.load(file_path, sr=self.sr, mono=True)
-            return y, sr
-        except Exception as e:
-            print(f"Error loading audio: {e}")
-            return np.array([]), self.sr
+            y, file_sr = sf.read(file_path, dtype='float32', always_2d=False)
+        except Exception:
+            # Formats libsndfile can't decode fall back to librosa (audioread)
+            try:
+                y, sr = librosa.load(file_path, sr=self.sr, mono=True)
+                return y, sr
+            except Exception as e:
+                print(f"Error loading audio: {e}")
+                return np.array([]), self.sr
+
+        if y.ndim == 2:
+            y = y.mean(axis=1)
+        if file_sr != self.sr and len(y) > 0:
+            g = math.gcd(self.sr, file_sr)
+            y = scipy.signal.resample_poly(y, self.sr // g, file_sr // g).astype(np.float32, copy=False)
+        return y, self.sr
+
+    @staticmethod
+    def is_silent(y: np.ndarray) -> bool:
+        """
+        Silence gate of extract_features: True for empty or near-silent audio (peak below
+        SILENCE_PEAK or overall RMS below SILENCE_RMS), where pitch tracking is skipped.
+        """
+        if len(y) == 0:
+            return True
+        peak = float(np.max(np.abs(y)))
+        rms_total = math.sqrt(float(np.dot(y, y)) / len(y))
+        return peak < SILENCE_PEAK or rms_total < SILENCE_RMS
 
-    def extract_features(self, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    def extract_features(self, y: np.ndarray, voice_part: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         """
         Extracts pitch (F0) and energy (RMS) from audio.
+        If voice_part is given, the F0 search is narrowed to that part's range
+        (pYIN cost scales with the fmin/fmax span).
         Returns: times, f0, rms, voiced_probs
         """
         if len(y) == 0:
             return np.array([]), np.array([]), np.array([]), np.array([])
 
-        # Pitch Tracking using pYIN
-        f0, voiced_flag, voiced_probs = librosa.pyin(
-            y,
-            fmin=librosa.note_to_hz('C2'),
-            fmax=librosa.note_to_hz('C6'),
-            sr=self.sr,
-            frame_length=2048,
-            hop_length=512
-        )
-        
-        # Energy (RMS)
         hop_length = 512
-        rms = librosa.feature.rms(y=y, frame_length=2048, hop_length=hop_length)[0]
-        times = librosa.times_like(rms, sr=self.sr, hop_length=hop_length)
+        fmin, fmax = self.pitch_search_range(voice_part)
+
+        # Energy (RMS) first: it's cheap and drives the silence checks below
+        rms = _frame_rms(y, frame_length=2048, hop_length=hop_length)
+        times = np.arange(len(rms)) * (hop_length / self.sr)
+        n_frames = len(rms)
         
-        # Align lengths
-        min_len = min(len(f0), len(rms), len(times))
-        f0 = f0[:min_len]
-        rms = rms[:min_len]
-        times = times[:min_len]
-        voiced_probs = voiced_probs[:min_len]
+        # Pitch tracks span the full frame grid; frames outside the analyzed span stay unvoiced
+        f0 = np.full(n_frames, np.nan)
+        voiced_probs = np.zeros(n_frames)
+
+        # Near-silent take (record hit too early, muted mic): nothing for pitch tracking to find
+        if self.is_silent(y):
+            return times, f0, rms, voiced_probs
+
+        # Trim leading/trailing silence (> SILENCE_TOP_DB below the loudest frame) before
+        # pitch tracking - its cost is linear in input length. Same criterion as
+        # librosa.effects.trim, but reusing the RMS frames computed above.
+        loud = np.flatnonzero(rms > rms.max() * 10.0 ** (-SILENCE_TOP_DB / 20.0))
+        # (keep 2 extra frames each side so the edge frames still see real samples, not padding)
+        first, last = max(int(loud[0]) - 2, 0), min(int(loud[-1]) + 2, n_frames - 1)
+        y_span = y[first * hop_length:(last + 1) * hop_length]
+
+        # Low parts never need more than a few hundred Hz of F0, so track pitch at half rate
+        # with half the hop/frame: same frame times and window length, half the samples.
+        q = PITCH_DECIMATION if fmax < LOW_VOICE_FMAX and hop_length % PITCH_DECIMATION == 0 else 1
+        pitch_sr = self.sr // q
+        if q > 1:
+            y_span = scipy.signal.resample_poly(y_span, 1, q).astype(np.float32, copy=False)
+
+        if self.pitch_backend == "pyworld":
+            span_f0, span_probs = self._track_pitch_pyworld(y_span, fmin, fmax, hop_length // q, sr=pitch_sr)
+        else:
+            # Pitch Tracking using pYIN
+            span_f0, voiced_flag, span_probs = librosa.pyin(
+                y_span,
+                fmin=fmin,
+                fmax=fmax,
+                sr=pitch_sr,
+                frame_length=2048 // q,
+                hop_length=hop_length // q
+            )
+        
+        # Align lengths (span frame j is full-grid frame first + j)
+        n_span = min(len(span_f0), n_frames - first)
+        f0[first:first + n_span] = span_f0[:n_span]
+        voiced_probs[first:first + n_span] = span_probs[:n_span]
         
         # Octave Jump Suppression (>700 cents frame-to-frame)
         # Simple iterative filter: if jump is too large, invalidate current frame or smooth
         # Here we invalidate to be safe (treat as unvoiced/noise)
-        cents_jump_threshold = 700
+        # (Carry-dependent scan over the last *kept* value, so it stays a loop - compiled.
+        #  f0 is our own full-grid buffer, so the scan edits it in place instead of copying.)
+        cents_jump_threshold = 700.0
+        cleaned_f0 = suppress_octave_jumps(f0, cents_jump_threshold)
         
-        cleaned_f0 = f0.copy()
-        
-        # Vectorized check is hard because it depends on previous valid value. 
-        # Iterative approach is safer for this specific logic.
-        last_valid = 0.0
-        for i in range(len(cleaned_f0)):
-            if np.isnan(cleaned_f0[i]):
-                continue
-            
-            if last_valid > 0:
-                # Calc diff in cents
-                diff = 1200 * np.log2(cleaned_f0[i] / last_valid)
-                if abs(diff) > cents_jump_threshold:
-                    # Jump detected. Invalidate this frame.
-                    cleaned_f0[i] = np.nan
-                    continue 
-            
-            last_valid = cleaned_f0[i]
-            
         return times, cleaned_f0, rms, voiced_probs
 
+    @staticmethod
+    def pitch_search_range(voice_part: Optional[str] = None) -> Tuple[float, float]:
+        """F0 search bounds: the part's range_hz with ~10% margin, or C2-C6 if unknown."""
+        if voice_part in VOICE_LIMITS_HZ:
+            min_hz, max_hz = VOICE_LIMITS_HZ[voice_part]
+            return min_hz * 0.9, max_hz * 1.1
+        return _note_hz('C2'), _note_hz('C6')
+
+    @staticmethod
+    def voiced_mask(f0: np.ndarray) -> np.ndarray:
+        """
+        Voiced-frame mask for the stored/plotted tracks (f0 is NaN where unvoiced).
+        calculate_metrics applies its own stricter filter (confidence + part range).
+        """
+        return np.isfinite(f0)
+
+    def _track_pitch_pyworld(self, y: np.ndarray, fmin: float, fmax: float, hop_length: int,
+                             sr: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        F0 via WORLD's DIO + StoneMask refinement, on the same hop grid as pYIN.
+        sr: rate of y if it isn't self.sr (decimated low-voice input).
+        Returns f0 (NaN where unvoiced, like pYIN) and a 0/1 voicing 'probability'.
+        """
+        sr = sr or self.sr
+        x = y.astype(np.float64)  # pyworld requires float64
+        frame_period = hop_length * 1000.0 / sr  # ms
+        f0, t = pyworld.dio(x, sr, f0_floor=fmin, f0_ceil=fmax, frame_period=frame_period)
+        f0 = pyworld.stonemask(x, f0, t, sr)
+        
+        voiced_probs = (f0 > 0).astype(np.float64)
+        f0[f0 <= 0] = np.nan
+        return f0, voiced_probs
+
     def calculate_metrics(self, f0: np.ndarray, rms: np.ndarray, voiced_probs: np.ndarray, 
                           target_note: Optional[str] = None, voice_part: str = "Soprano") -> dict:
         """
@@ -106,25 +222,30 @@ class AudioProcessor:
         
         # 1. Filter by Confidence & Voice Range
         confidence_threshold = 0.3 # stricter than default
-        voice_limits = PASSAGGIO_CRITERIA.get(voice_part, {}).get("range_hz", [50, 2000])
-        min_hz, max_hz = voice_limits[0], voice_limits[1]
-
-        # Valid mask: Not NaN, Confidence high, Within Hz range
-        valid_mask = (
-            (~np.isnan(f0)) & 
-            (voiced_probs > confidence_threshold) & 
-            (f0 >= min_hz) & 
-            (f0 <= max_hz)
-        )
-        
-        voiced_f0 = f0[valid_mask]
+        min_hz, max_hz = VOICE_LIMITS_HZ.get(voice_part, (50, 2000))
+
+        # Target (if any) and pre-passaggio split, resolved before the single pass
+        target_log2hz = 0.0
+        if target_note:
+            # log2 of the target makes the kernel's cents math a subtraction
+            target_log2hz = math.log2(_note_hz(target_note))
+        primary_passaggio = PRIMARY_PASSAGGIO_HZ.get(voice_part, 300.0)
+
+        # Valid frames: Not NaN, Confidence high, Within Hz range.
+        # Masking and every statistic below come out of one compiled pass over f0.
+        # (The kernel reads the float64 track as-is: a float32 copy of the voiced frames
+        #  would be an extra pass over f0 just to make this single pass narrower.)
+        (n_valid, mean_hz, accuracy, on_target_ratio,
+         std_all, n_pre, std_pre, trend) = voiced_pitch_stats(
+            f0, voiced_probs, confidence_threshold, float(min_hz), float(max_hz),
+            target_log2hz, 50.0, primary_passaggio)
         
         # Voiced Ratio
         total_frames = len(f0)
         if total_frames > 0:
-            metrics["voiced_ratio"] = len(voiced_f0) / total_frames
+            metrics["voiced_ratio"] = n_valid / total_frames
         
-        if len(voiced_f0) == 0:
+        if n_valid == 0:
             metrics["confidence"] = "Low"
             # Metrics remain at default (999.0 = Bad)
             return metrics
@@ -132,27 +253,19 @@ class AudioProcessor:
         if metrics["voiced_ratio"] < 0.7:  # User constraint: < 70% is low confidence
             metrics["confidence"] = "Low"
 
-        metrics["mean_pitch_hz"] = float(np.mean(voiced_f0)) # Just for info
+        metrics["mean_pitch_hz"] = float(mean_hz) # Just for info
 
         # 2. Pitch Accuracy (Median, Octave Corrected, Clamped)
         if target_note:
-            target_hz = librosa.note_to_hz(target_note)
-            
             # Strict Accuracy: NO Octave Correction
             # User must sing the exact target note.
             
-            # Calculate cents error directly against target_hz
-            err = 1200 * np.log2(voiced_f0 / target_hz)
-            min_cents_error = np.abs(err)
-            
             # Metric 1: Accuracy (Mean Error) - Penalize drops significantly
-            # Previously used Median, which hid short drops.
-            metrics["accuracy"] = float(np.mean(min_cents_error))
-            
+            #   (Previously used Median, which hid short drops.)
             # Metric 2: On-Target Ratio
-            # Percentage of frames within +/- 50 cents of target
-            on_target_mask = min_cents_error <= 50.0
-            metrics["on_target_ratio"] = float(np.mean(on_target_mask))
+            #   Percentage of frames within +/- 50 cents of target
+            metrics["accuracy"] = float(accuracy)
+            metrics["on_target_ratio"] = float(on_target_ratio)
             
             # Clamp accuracy to 0-200 for sanity
             metrics["accuracy"] = min(200.0, metrics["accuracy"])
@@ -160,41 +273,21 @@ class AudioProcessor:
              metrics["on_target_ratio"] = 0.0
         
         # 3. Pitch Stability (Pre-Passaggio Primary)
-        # Determine Pre/Post regions
-        passaggio_hzs = PASSAGGIO_CRITERIA.get(voice_part, {}).get("passaggio_hz", [])
-        primary_passaggio = passaggio_hzs[0] if passaggio_hzs else 300.0
-        
-        # Pre-Passaggio frames (< primary_passaggio)
-        pre_mask = voiced_f0 < primary_passaggio
-        post_mask = voiced_f0 >= primary_passaggio
-        
-        pre_f0 = voiced_f0[pre_mask]
-        
-        if len(pre_f0) > 10:
-            # Calculate stability on Pre-region
-            # Std dev in cents relative to *its own mean* (or target if available?)
-            # Usually stability is fluctuation around the sung note. 
-            # If it's a scale, std dev is huge. 
-            # Assuming Sustained Note tests (T1, T6) mostly.
-            # For scales, this metric might need separate logic (e.g. smoothness).
-            # User said "Use Pre-passaggio stability".
-            
-            ref = np.mean(pre_f0)
-            cents_dev = 1200 * np.log2(pre_f0 / ref)
-            metrics["stability"] = float(np.std(cents_dev))
-        else:
-            # Fallback to whole if no pre-passaggio content (e.g. high soprano singing high)
-            ref = np.mean(voiced_f0)
-            cents_dev = 1200 * np.log2(voiced_f0 / ref)
-            metrics["stability"] = float(np.std(cents_dev))
+        # Calculate stability on Pre-region (frames < primary_passaggio) if it has > 10 frames,
+        # otherwise fall back to whole (e.g. high soprano singing high).
+        # Std dev in cents relative to *its own mean* (or target if available?)
+        # Usually stability is fluctuation around the sung note. 
+        # If it's a scale, std dev is huge. 
+        # Assuming Sustained Note tests (T1, T6) mostly.
+        # For scales, this metric might need separate logic (e.g. smoothness).
+        # User said "Use Pre-passaggio stability".
+        metrics["stability"] = float(std_pre if n_pre > 10 else std_all)
 
         # 4. Pitch Drift (End - Start)
+        # Fitted end-minus-start of a least-squares line over log-pitch: uses every voiced
+        # frame (octave jumps are already suppressed) instead of two 20-frame medians.
         window = 20
-        if len(voiced_f0) > window * 2:
-            # Median of start/end to be robust to outliers
-            start_pitch = np.median(voiced_f0[:window])
-            end_pitch = np.median(voiced_f0[-window:])
-            if start_pitch > 0 and end_pitch > 0:
-                metrics["drift"] = 1200 * np.log2(end_pitch / start_pitch)
+        if n_valid > window * 2:
+            metrics["drift"] = float(trend)
 
         return metrics
@@ -0,0 +1,119 @@
+# Vocal Diagnostic Report - Compiled inner loops for AudioProcessor
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the kernels below run as plain Python loops.
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+
+# fastmath without 'nnan'/'ninf': the unvoiced (NaN) frame tests must survive optimization
+_NAN_SAFE_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+
+@njit(cache=True, fastmath=_NAN_SAFE_FASTMATH)
+def voiced_pitch_stats(f0, voiced_probs, prob_thr, min_hz, max_hz, target_log2hz, tol_cents, split_hz):
+    """
+    All of calculate_metrics' per-frame work in one pass over the raw f0 track.
+    A frame is kept if it is voiced, confident (voiced_probs > prob_thr) and within
+    [min_hz, max_hz]; NaN (unvoiced) frames fail the range test on their own.
+    log2(f0) is taken once per kept frame and shared by every statistic:
+      - mean |cents error| vs target_log2hz and the fraction within +/- tol_cents
+        (a range check against the tolerance band in Hz),
+      - std in cents of all kept frames and of those below split_hz (pre-passaggio),
+        via Welford: std(1200*log2(f/ref)) == 1200*std(log2(f)), so no ref is needed,
+      - the least-squares trend of log-pitch over the kept-frame index, as the fitted
+        end-minus-start change in cents (online index/log2 co-moment; the k-th kept
+        frame has index k, so sum((k - mean)^2) = n(n^2-1)/12 in closed form).
+    Returns (n, mean_hz, mean_abs_cents, on_target_ratio, std_cents_all, n_pre, std_cents_pre, trend_cents).
+    """
+    lower = 2.0 ** (target_log2hz - tol_cents / 1200.0)
+    upper = 2.0 ** (target_log2hz + tol_cents / 1200.0)
+
+    n = 0
+    sum_hz = 0.0
+    abs_cents = 0.0
+    on_target = 0
+    mean_all = 0.0
+    m2_all = 0.0
+    cov_all = 0.0
+    n_pre = 0
+    mean_pre = 0.0
+    m2_pre = 0.0
+    for i in range(f0.shape[0]):
+        v = f0[i]
+        if not (v >= min_hz and v <= max_hz and voiced_probs[i] > prob_thr):
+            continue
+        x = math.log2(v)
+
+        sum_hz += v
+        abs_cents += abs(1200.0 * (x - target_log2hz))
+        if v >= lower and v <= upper:
+            on_target += 1
+
+        # Index of this frame is k = n (before increment); mean of the previous indices is (k-1)/2
+        k = n
+        n += 1
+        d = x - mean_all
+        mean_all += d / n
+        m2_all += d * (x - mean_all)
+        cov_all += 0.5 * (k + 1) * (x - mean_all)
+
+        if v < split_hz:
+            n_pre += 1
+            d = x - mean_pre
+            mean_pre += d / n_pre
+            m2_pre += d * (x - mean_pre)
+
+    if n == 0:
+        return 0, 0.0, 0.0, 0.0, 0.0, 0, 0.0, 0.0
+
+    std_pre = 1200.0 * math.sqrt(m2_pre / n_pre) if n_pre > 0 else 0.0
+    trend = 0.0
+    if n > 1:
+        sxx = n * (n * n - 1) / 12.0
+        trend = 1200.0 * (cov_all / sxx) * (n - 1)
+    return (n, sum_hz / n, abs_cents / n, on_target / n,
+            1200.0 * math.sqrt(m2_all / n), n_pre, std_pre, trend)
+
+
+@njit(cache=True)
+def suppress_octave_jumps(f0, thr_cents):
+    """
+    Sets every frame of f0 that jumps more than thr_cents from the last kept (non-NaN)
+    frame to NaN, in place, and returns f0. No fastmath: the NaN checks must hold.
+    |1200*log2(v/last)| > thr  <=>  v > last*r or v < last/r  with r = 2**(thr/1200),
+    so the scan itself needs no log at all.
+    """
+    ratio_hi = 2.0 ** (thr_cents / 1200.0)
+    ratio_lo = 1.0 / ratio_hi
+    last_valid = 0.0
+    for i in range(f0.shape[0]):
+        v = f0[i]
+        if np.isnan(v):
+            continue
+
+        if last_valid > 0:
+            if v > last_valid * ratio_hi or v < last_valid * ratio_lo:
+                # Jump detected. Invalidate this frame.
+                f0[i] = np.nan
+                continue
+
+        last_valid = v
+    return f0
+
+
+def _warmup():
+    """Compile once at import so the first analysis doesn't pay the JIT cost."""
+    dummy = np.full(16, 440.0)
+    voiced_pitch_stats(dummy, np.ones(16), 0.3, 50.0, 2000.0, math.log2(440.0), 50.0, 300.0)
+    dummy[::4] = np.nan
+    suppress_octave_jumps(dummy, 700.0)
+
+
+_warmup()
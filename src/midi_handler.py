@@ -8,29 +8,22 @@ def synthesis_midi_track(midi_data, track_index: int, fs=44100) -> io.BytesIO:
     Synthesizes a specific MIDI track to audio (sine wave).
     Returns wav bytes buffer.
     """
-    # Create a new MIDI object with only the selected instrument
-    temp_midi = pretty_midi.PrettyMIDI()
-    
-    # Copy the selected instrument
+    # Synthesize only the selected instrument
     if 0 <= track_index < len(midi_data.instruments):
         inst = midi_data.instruments[track_index]
-        temp_midi.instruments.append(inst)
     else:
         return None
 
     # Synthesize
-    # sine wave synthesis is supported by pretty_midi via synthesize() function (uses sine wave by default if no fluid)
-    # properly it uses 'fluidsynth' if installed, or simple synthesized wave.
-    # verify if synthesize() works without fluidsynth. 
-    # pretty_midi.synthesize() doc: "Synthesize the MIDI using a sine wave... if fs is not None"
-    
-    audio_data = temp_midi.synthesize(fs=fs)
-    
-    # Normalize
-    audio_data = audio_data / np.max(np.abs(audio_data)) if np.max(np.abs(audio_data)) > 0 else audio_data
+    # Instrument.synthesize() renders the notes as sine waves directly; wrapping the
+    # instrument in a throwaway PrettyMIDI only to call its synthesize() isn't needed.
+    audio_data = inst.synthesize(fs=fs)
     
-    # Convert to 16-bit PCM
-    waveform_int16 = (audio_data * 32767).astype(np.int16)
+    # Normalize + convert to 16-bit PCM (one peak scan, one scale, one cast)
+    peak = float(np.max(np.abs(audio_data))) if len(audio_data) > 0 else 0.0
+    if peak > 0:
+        audio_data *= 32767.0 / peak
+    waveform_int16 = audio_data.astype(np.int16)
     
     buf = io.BytesIO()
     wavfile.write(buf, fs, waveform_int16)
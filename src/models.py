@@ -2,6 +2,10 @@ from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
 import datetime
 import uuid
+import numpy as np
+
+def _empty_track() -> np.ndarray:
+    return np.empty(0, dtype=np.float32)
 
 @dataclass
 class TagInstance:
@@ -17,12 +21,15 @@ class TestResult:
     test_name: str
     audio_file_path: Optional[str] = None
     video_file_path: Optional[str] = None
+    audio_digest: Optional[str] = None # Content hash of the recording (analysis cache key)
     
-    # Analysis Data (Time-series)
-    pitch_track_time: List[float] = field(default_factory=list)
-    pitch_track_hz: List[float] = field(default_factory=list)
-    energy_track_time: List[float] = field(default_factory=list)
-    energy_track_rms: List[float] = field(default_factory=list)
+    # Analysis Data (Time-series, contiguous float32 arrays)
+    pitch_track_time: np.ndarray = field(default_factory=_empty_track)
+    pitch_track_hz: np.ndarray = field(default_factory=_empty_track) # NaN where unvoiced
+    energy_track_time: np.ndarray = field(default_factory=_empty_track)
+    energy_track_rms: np.ndarray = field(default_factory=_empty_track)
+    voiced_mask: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool)) # Aligned with pitch_track_hz
+    duration_s: float = 0.0 # Last analysis frame time (full resolution)
     
     # Derived Metrics (Scalar)
     pitch_accuracy_cents: float = 0.0 # Error from target
@@ -1,4 +1,5 @@
 import os
+import threading
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 from reportlab.lib import colors
@@ -6,7 +7,11 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg") # Headless: the report is only ever rasterized to PNG
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image as PILImage
 import matplotlib.font_manager as fm
 import numpy as np
 from .models import StudentSession
@@ -23,11 +28,25 @@ except Exception as e:
     print(f"Font Load Error: {e}")
     font_name = 'Helvetica' # Fallback
 
+# Matplotlib side of the font, resolved once at import (FontProperties scans the file)
+try:
+    FONT_PROP = fm.FontProperties(fname=FONT_PATH)
+    matplotlib.rcParams['font.family'] = FONT_PROP.get_name()
+except Exception as e:
+    print(f"Chart Font Error: {e}")
+    FONT_PROP = None
+
 class PDFGenerator:
     def __init__(self):
         self.width, self.height = A4
         self.styles = getSampleStyleSheet()
         self.create_custom_styles()
+        # One chart figure per generator, cleared and redrawn for each report.
+        # The generator is shared across sessions, so drawing on it is serialized.
+        self._fig = Figure(figsize=(8, 4), dpi=150)
+        self._fig_lock = threading.Lock()
+        FigureCanvasAgg(self._fig) # attaches itself as self._fig.canvas
+        self._axes = self._fig.subplots(2, 1, sharex=True)
 
     def create_custom_styles(self):
         # Override Normal style with Korean font
@@ -44,47 +63,48 @@ class PDFGenerator:
 
     def create_charts(self, session: StudentSession) -> BytesIO:
         """Generates charts for Before/After comparison."""
-        # Configure Matplotlib Font
-        try:
-            prop = fm.FontProperties(fname=FONT_PATH)
-            plt.rcParams['font.family'] = prop.get_name()
-        except:
-            pass
+        with self._fig_lock:
+            return self._draw_charts(session)
+
+    def _draw_charts(self, session: StudentSession) -> BytesIO:
+        prop = FONT_PROP
             
-        # Create figure using OO Application interface
-        fig, ax = plt.subplots(2, 1, figsize=(8, 4), sharex=True)
+        # Reuse the generator's figure (OO interface, no pyplot state)
+        fig, ax = self._fig, self._axes
+        for a in ax:
+            a.cla()
         
         # Test 1 (Before)
         t1 = session.get_result("T1")
-        if t1 and t1.pitch_track_hz:
-            times = np.array(t1.pitch_track_time)
-            pitch = np.array(t1.pitch_track_hz)
-            voiced_mask = pitch > 0
-            ax[0].plot(times[voiced_mask], pitch[voiced_mask], label='Before (Test 1)', color='blue')
+        if t1 and len(t1.pitch_track_hz) > 0:
+            # Voiced frames come from the mask stored at analysis time
+            times = t1.pitch_track_time[t1.voiced_mask]
+            pitch = t1.pitch_track_hz[t1.voiced_mask]
+            ax[0].plot(times, pitch, label='Before (Test 1)', color='blue')
             ax[0].set_ylabel("Freq (Hz)")
             ax[0].legend(prop=prop)
             ax[0].grid(True, alpha=0.3)
 
         # Test 6 (After)
         t6 = session.get_result("T6")
-        if t6 and t6.pitch_track_hz:
-            times = np.array(t6.pitch_track_time)
-            pitch = np.array(t6.pitch_track_hz)
-            voiced_mask = pitch > 0
-            ax[0].plot(times[voiced_mask], pitch[voiced_mask], label='After (Test 6)', color='green', linestyle='--')
+        if t6 and len(t6.pitch_track_hz) > 0:
+            # Voiced frames come from the mask stored at analysis time
+            times = t6.pitch_track_time[t6.voiced_mask]
+            pitch = t6.pitch_track_hz[t6.voiced_mask]
+            ax[0].plot(times, pitch, label='After (Test 6)', color='green', linestyle='--')
             ax[0].legend(prop=prop)
 
         ax[0].set_title("Pitch Stability Comparison", fontproperties=prop)
 
         # Energy Comparison
-        if t1 and t1.energy_track_rms:
-            times = np.array(t1.energy_track_time)
-            energy = np.array(t1.energy_track_rms)
+        if t1 and len(t1.energy_track_rms) > 0:
+            times = t1.energy_track_time
+            energy = t1.energy_track_rms
             ax[1].plot(times, energy, label='Before', color='orange')
         
-        if t6 and t6.energy_track_rms:
-            times = np.array(t6.energy_track_time)
-            energy = np.array(t6.energy_track_rms)
+        if t6 and len(t6.energy_track_rms) > 0:
+            times = t6.energy_track_time
+            energy = t6.energy_track_rms
             ax[1].plot(times, energy, label='After', color='red', linestyle='--')
             
         ax[1].set_ylabel("Energy (RMS)")
@@ -93,12 +113,14 @@ class PDFGenerator:
         ax[1].grid(True, alpha=0.3)
         ax[1].set_title("Energy/Breath Control Comparison", fontproperties=prop)
 
-        plt.tight_layout()
+        fig.tight_layout()
         
+        # Encode the Agg buffer with Pillow: skips savefig's extra print_figure pass, and
+        # a low zlib level is plenty for a chart that is embedded in a PDF anyway.
+        fig.canvas.draw()
         img_buffer = BytesIO()
-        plt.savefig(img_buffer, format='png', dpi=150)
+        PILImage.fromarray(np.asarray(fig.canvas.buffer_rgba())).save(img_buffer, format='PNG', compress_level=1)
         img_buffer.seek(0)
-        plt.close(fig)
         return img_buffer
 
     def generate_report(self, session: StudentSession, filepath: str):
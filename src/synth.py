@@ -1,12 +1,19 @@
 import numpy as np
 import soundfile as sf
 import io
+from src.synth_kernels import mix_notes
+
+# Additive partials: harmonic number k and amplitude (fundamental strong, overtones weaker)
+# (float32 throughout: 16-bit output can't resolve float64 intermediates)
+_HARMONICS = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)[:, None]
+_HARMONIC_AMPS = np.array([1.0, 0.5, 0.25, 0.12], dtype=np.float32)
 
 def generate_piano_note(freq, duration, sr=44100):
     """
     Generates a single piano-like note using additive synthesis and ADSR envelope.
     """
-    t = np.linspace(0, duration, int(sr * duration), endpoint=False)
+    n_samples = int(sr * duration)
+    t = np.arange(n_samples, dtype=np.float32) / np.float32(sr)
     
     # Piano Physics Approximation:
     # 1. Harmonics: Fundamental is strong, overtones decay faster.
@@ -14,14 +21,14 @@ def generate_piano_note(freq, duration, sr=44100):
     # 3. Envelope: Percussive attack, long decay.
     
     # 1. Base Waveform (Sum of Sines)
-    # Fundamental
-    wave = 1.0 * np.sin(2 * np.pi * freq * t)
-    # 2nd Harmonic
-    wave += 0.5 * np.sin(2 * np.pi * freq * 2 * t)
-    # 3rd Harmonic
-    wave += 0.25 * np.sin(2 * np.pi * freq * 3 * t)
-    # 4th Harmonic
-    wave += 0.12 * np.sin(2 * np.pi * freq * 4 * t)
+    # Fundamental + 2nd/3rd/4th Harmonics: one sin over a (4, N) phase matrix,
+    # weighted and summed by a single matrix-vector product
+    # Fundamental phase is wrapped to one cycle in float64 before narrowing, so float32
+    # keeps full phase precision on long notes.
+    cycles = np.arange(n_samples) * (freq / sr)
+    np.mod(cycles, 1.0, out=cycles)
+    phases = _HARMONICS * (2 * np.pi * cycles).astype(np.float32)
+    wave = _HARMONIC_AMPS @ np.sin(phases, out=phases)
     
     # 2. Amplitude Envelope (ADSR)
     # Attack: 0.01s (Fast hammer strike)
@@ -31,23 +38,23 @@ def generate_piano_note(freq, duration, sr=44100):
     attack_time = 0.01
     attack_samples = int(attack_time * sr)
     
-    envelope = np.ones_like(t)
+    envelope = np.empty_like(t)
     
     # Attack Phase
     if attack_samples > 0:
-        envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
+        envelope[:attack_samples] = np.linspace(0, 1, len(envelope[:attack_samples]))
     
     # Decay Phase (Exponential)
     # Decay rate depends on frequency (Higher notes decay faster)
     decay_rate = 3.0 # Tuning parameter
-    decay_curve = np.exp(-decay_rate * t)
     
-    # Apply Decay from end of attack
-    if attack_samples < len(t):
-        envelope[attack_samples:] = decay_curve[attack_samples:]
+    # Apply Decay from end of attack (computed straight into the envelope, only where used)
+    decay = envelope[attack_samples:]
+    np.multiply(t[attack_samples:], -decay_rate, out=decay)
+    np.exp(decay, out=decay)
         
-    final_wave = wave * envelope
-    return final_wave
+    wave *= envelope
+    return wave
 
 def synthesize_midi_with_piano(midi_data, track_index, sr=44100):
     """
@@ -59,48 +66,55 @@ def synthesize_midi_with_piano(midi_data, track_index, sr=44100):
     total_samples = int(sr * length_sec)
     
     # Main mix buffer
-    mix_buffer = np.zeros(total_samples)
+    mix_buffer = np.zeros(total_samples, dtype=np.float32)
     
     # Get track
     if not (0 <= track_index < len(midi_data.instruments)):
         return None
     track = midi_data.instruments[track_index]
     
+    # Rendered notes keyed by (pitch, duration in 0.1 s buckets): choir parts repeat a few
+    # dozen pitches/lengths across hundreds of notes, so each is synthesized once per track.
+    note_index = {}
+    rendered = []
+    note_ids = np.empty(len(track.notes), dtype=np.int64)
+    starts = np.empty(len(track.notes), dtype=np.int64)
+    
     # Iterate Notes
-    for note in track.notes:
+    for i, note in enumerate(track.notes):
         start_time = note.start
         end_time = note.end
         duration = end_time - start_time
-        freq = 440 * (2 ** ((note.pitch - 69) / 12))
         
         # Generate Note Audio
         # Limit note duration to avoid huge arrays if MIDI is weird, but usually fine.
         # Add a bit of release time?
         actual_duration = duration + 0.5 # Let it ring a bit
-        note_audio = generate_piano_note(freq, actual_duration, sr)
+        key = (note.pitch, int(round(actual_duration * 10)))
+        idx = note_index.get(key)
+        if idx is None:
+            freq = 440 * (2 ** ((note.pitch - 69) / 12))
+            idx = note_index[key] = len(rendered)
+            rendered.append(generate_piano_note(freq, key[1] / 10, sr))
+        note_ids[i] = idx
         
         # Calculate start index
-        start_idx = int(start_time * sr)
-        end_idx = start_idx + len(note_audio)
-        
-        # Add to mix (Handle bounds)
-        if end_idx > total_samples:
-            # Crop note or extend buffer? Crop for now.
-            valid_len = total_samples - start_idx
-            mix_buffer[start_idx:total_samples] += note_audio[:valid_len]
-        else:
-            mix_buffer[start_idx:end_idx] += note_audio
+        starts[i] = int(start_time * sr)
+    
+    # Add to mix (compiled; notes running past the buffer end are cropped)
+    if rendered:
+        note_offsets = np.zeros(len(rendered) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in rendered], out=note_offsets[1:])
+        mix_notes(mix_buffer, np.concatenate(rendered), note_offsets, note_ids, starts)
             
-    # Normalize
+    # Normalize straight to 16-bit full scale (one in-place pass), so soundfile
+    # writes the int16 samples as-is instead of converting float on the fly
     max_val = np.max(np.abs(mix_buffer))
     if max_val > 0:
-        mix_buffer = mix_buffer / max_val
+        mix_buffer *= 32767.0 / max_val
+    pcm = mix_buffer.astype(np.int16)
         
-    # soundfile expects float32/float64 [-1, 1] usually, or int16.
-    # Let's stick to float32 for soundfile
-    waveform_float = mix_buffer.astype(np.float32)
-
     buf = io.BytesIO()
-    sf.write(buf, waveform_float, sr, format='WAV', subtype='PCM_16')
+    sf.write(buf, pcm, sr, format='WAV', subtype='PCM_16')
     buf.seek(0)
     return buf
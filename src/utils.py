@@ -1,4 +1,6 @@
 # Vocal Diagnostic Report - Utilities & Constants
+import math
+import re
 
 # Part Definitions
 PARTS = ["Soprano", "Alto", "Tenor", "Baritone", "Bass"]
@@ -38,6 +40,38 @@ PASSAGGIO_CRITERIA = {
     },
 }
 
+# Per-part analysis constants flattened out of PASSAGGIO_CRITERIA once at import,
+# so the metrics path does plain dict lookups instead of nested .get() walks.
+VOICE_LIMITS_HZ = {part: tuple(c["range_hz"]) for part, c in PASSAGGIO_CRITERIA.items()}
+PRIMARY_PASSAGGIO_HZ = {part: c["passaggio_hz"][0] for part, c in PASSAGGIO_CRITERIA.items() if c["passaggio_hz"]}
+
+# Sustained-test target notes (Passaggio Start) per part
+TARGET_NOTES = {
+    "Soprano": "F5",
+    "Alto": "E5",
+    "Tenor": "F4",
+    "Baritone": "E4",
+    "Bass": "Eb4",
+}
+
+_NOTE_RE = re.compile(r"^([A-Ga-g])([#b]*)(-?\d+)$")
+_PITCH_CLASS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+def note_to_hz(note: str) -> float:
+    """
+    Equal-tempered frequency (A4 = 440 Hz) of a plain note name such as "F5" or "Eb4".
+    Same formula as librosa.note_to_hz, without importing librosa at app startup.
+    """
+    m = _NOTE_RE.match(note)
+    if not m:
+        raise ValueError(f"Unsupported note name: {note}")
+    letter, accidentals, octave = m.groups()
+    midi = 12 * (int(octave) + 1) + _PITCH_CLASS[letter.upper()] + accidentals.count("#") - accidentals.count("b")
+    return 440.0 * 2.0 ** ((midi - 69) / 12.0)
+
+# Target frequencies for display/reference tones, derived from TARGET_NOTES at import
+TARGET_HZ = {part: note_to_hz(note) for part, note in TARGET_NOTES.items()}
+
 # Test Definitions
 TESTS = [
     {
@@ -84,6 +118,27 @@ TESTS = [
     }
 ]
 
+# Diagnosis Rules
+# Format: (TestResult attribute, lower bound (inclusive), upper bound (exclusive), message)
+# Ranges for the same attribute are disjoint (if/elif semantics), so every rule can be
+# evaluated independently as one vectorized comparison. Strict '>' uses math.nextafter.
+DIAGNOSIS_RULES = [
+    # Accuracy
+    ("pitch_accuracy_cents", 900.0, math.inf, "음정이 감지되지 않았거나 분석에 실패했습니다. (소음/무음)"),
+    ("pitch_accuracy_cents", math.nextafter(50.0, math.inf), 900.0, "피치가 목표음보다 평균 {value:.1f} cents 벗어났습니다. (정확도 주의)"),
+    ("pitch_accuracy_cents", -math.inf, 20.0, "피치 정확도가 매우 우수합니다."),
+    # Stability (>= 900 is already covered by the accuracy failure message)
+    ("pitch_stability_cents", math.nextafter(30.0, math.inf), 900.0, "음의 흔들림(Vibrato/Tremolo)이 다소 큽니다. 호흡 지탱을 확인하세요."),
+    ("pitch_stability_cents", 0.0, 10.0, "음이 매우 안정적입니다 (Straight Tone)."),
+    # Drift
+    ("pitch_drift_cents", -math.inf, -20.0, "끝음이 처지는 경향(Flat Drift)이 있습니다."),
+    ("pitch_drift_cents", math.nextafter(20.0, math.inf), math.inf, "끝음이 샵되는 경향(Sharp Drift)이 있습니다."),
+    # New Strict Check: On-Target Ratio
+    ("pitch_on_target_ratio", -math.inf, 0.6, "음정이 불안정하여 목표음을 많이 벗어납니다. (정확도 < 60%)"),
+    ("pitch_on_target_ratio", 0.6, 0.85, "중간중간 음정이 흔들립니다. 호흡 지탱에 신경쓰세요."),
+]
+DIAGNOSIS_DEFAULT = "전반적으로 안정적인 발성입니다. 세부 지표인 비브라토 속도 등을 체크해보세요."
+
 def get_frequency_from_note(note_name):
     # This can be implemented using librosa.note_to_hz later
     pass
@@ -1,121 +1,234 @@
+import math
 import cv2
-import mediapipe as mp
 import numpy as np
 import pandas as pd
-import tempfile
-import os
+import queue
+import threading
+import streamlit as st
+
+# Frames wider than this are downscaled (INTER_AREA) before Face Mesh; also the thumbnail width
+INFERENCE_WIDTH = 640
+
+
+@st.cache_resource
+def _get_face_mesh(_mp_face_mesh, max_num_faces=1, min_tracking_confidence=0.5):
+    """
+    One FaceMesh graph per configuration per server process (model load is a few hundred
+    ms), shared by every VideoProcessor. The graph isn't reentrant, so it comes with a lock.
+    """
+    # Tracking mode (static_image_mode=False) reuses the previous frame's face box, so the
+    # detector only reruns when tracking is lost. Attention refinement (iris + lip/eye
+    # contours) is off: it is extra inference on every frame, and the openness ratio
+    # (lip gap as % of face height, landmarks 13/14/10/152) doesn't need it.
+    # A lower min_tracking_confidence keeps tracking (and skips the detector) for longer;
+    # a higher one re-detects more often.
+    face_mesh = _mp_face_mesh.FaceMesh(
+        static_image_mode=False,
+        max_num_faces=max_num_faces,
+        refine_landmarks=False,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=min_tracking_confidence
+    )
+    return face_mesh, threading.Lock()
+
 
 class VideoProcessor:
-    def __init__(self):
-        import mediapipe as mp
-        import streamlit as st
+    def __init__(self, stride=3, max_num_faces=1, min_tracking_confidence=0.5):
+        import mediapipe as mp # loaded on first VideoProcessor(), not when only the chart is drawn
         
-        # Debugging MediaPipe Integrity
-        try:
-            st.toast(f"MP Version: {mp.__version__}")
-            if hasattr(mp, 'solutions'):
-                self.mp_face_mesh = mp.solutions.face_mesh
-                st.toast("MediaPipe Solutions Loaded ✅")
-            else:
-                st.error("MediaPipe loaded but has no 'solutions' attribute!")
-                # Attempt manual submodule import as last ditch
-                import mediapipe.python.solutions.face_mesh as fm
-                self.mp_face_mesh = fm
-                st.warning("Force imported face_mesh from mediapipe.python.solutions")
-        except Exception as e:
-            st.error(f"MediaPipe Import Error: {e}")
-            raise e
+        # No st.* calls here: this runs inside the st.cache_data'd analysis, whose element
+        # calls Streamlit would replay on every cache hit. Import errors propagate to the
+        # caller's error display; versions are shown by app.probe_video_libs.
+        if hasattr(mp, 'solutions'):
+            self.mp_face_mesh = mp.solutions.face_mesh
+        else:
+            # Some builds don't expose 'solutions' on the package: import the submodule directly
+            import mediapipe.python.solutions.face_mesh as fm
+            self.mp_face_mesh = fm
 
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=False,
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        # Run Face Mesh on every stride-th frame only (10 fps for 30 fps video is plenty
+        # for the openness chart); skipped frames are grabbed but never converted/inferred.
+        self.stride = max(1, int(stride))
+
+        self.face_mesh, self._face_mesh_lock = _get_face_mesh(
+            self.mp_face_mesh, int(max_num_faces), float(min_tracking_confidence))
 
     def process_video(self, video_file_path, rotate=False):
         """
         Processes video to extract facial tension metrics.
         Returns (DataFrame, Max_Opening_Frame_RGB).
         """
-        cap = cv2.VideoCapture(video_file_path)
+        # The shared graph runs one video at a time; reset() drops the previous
+        # video's tracked face so this one starts from a fresh detection.
+        with self._face_mesh_lock:
+            self.face_mesh.reset()
+            return self._process_video(video_file_path, rotate)
+
+    @staticmethod
+    def _open_capture(video_file_path):
+        """
+        Opens the video through FFmpeg with any available hardware decoder (VAAPI, NVDEC,
+        VideoToolbox...), freeing CPU for Face Mesh. Falls back to the default backend
+        on OpenCV builds without the option or when FFmpeg can't open the file.
+        """
+        if hasattr(cv2, "VIDEO_ACCELERATION_ANY"):
+            cap = cv2.VideoCapture(video_file_path, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+            if cap.isOpened():
+                return cap
+            cap.release()
+        return cv2.VideoCapture(video_file_path)
+
+    def _read_frames(self, cap, frames, free, stop):
+        """
+        Decoder thread: reads every stride-th frame into a recycled buffer from `free` and
+        queues (frame_index, frame) on `frames`; None marks the end of the video.
+        """
+        frame_count = 0
+        try:
+            while not stop.is_set():
+                if frame_count % self.stride != 0:
+                    # Skipped frame: advance the decoder without retrieving the image
+                    if not cap.grab():
+                        break
+                    frame_count += 1
+                    continue
+                
+                success, frame = cap.read(free.get())
+                if not success:
+                    break
+                frames.put((frame_count, frame))
+                frame_count += 1
+        finally:
+            frames.put(None)
+
+    def _process_video(self, video_file_path, rotate):
+        cap = self._open_capture(video_file_path)
         if not cap.isOpened():
             raise ValueError(f"Could not open video file: {video_file_path}. Codec or path issue.")
             
         fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = 0
+        inv_fps = 1.0 / fps if fps > 0 else 1.0 / 30 # some containers report 0 fps; assume 30
         
-        data = []
+        # Column-wise samples (one list per DataFrame column, not one dict per frame)
+        columns = {"time": [], "vertical_opening": [], "face_height": [], "openness": []}
         max_openness = -1
         max_frame_rgb = None
         
-        while cap.isOpened():
-            success, image = cap.read()
-            if not success:
-                break
-            
-            # Rotation Correction (Simple 90 deg clockwise if requested)
-            if rotate:
-                image = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+        # Per-frame buffers, allocated on the first frame and then converted into in place
+        # (Face Mesh copies its input; the best frame's buffer is swapped out below)
+        rotated_buf = small_buf = image_rgb = None
+        h = w = small_size = None
+        
+        # Decode runs on a background thread (OpenCV releases the GIL while decoding), so it
+        # overlaps Face Mesh inference. Decoded frames wait in a bounded queue; their buffers
+        # cycle back through `free` once converted (queue + one in flight each side).
+        frames = queue.Queue(maxsize=8)
+        free = queue.Queue()
+        for _ in range(frames.maxsize + 2):
+            free.put(None) # cap.read allocates on first use
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read_frames, args=(cap, frames, free, stop), daemon=True)
+        reader.start()
+        
+        item = ()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                frame_count, frame = item
+                image = frame
                 
-            # Convert BGR to RGB
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = self.face_mesh.process(image_rgb)
-            
-            timestamp = frame_count / fps
-            
-            if results.multi_face_landmarks:
-                for face_landmarks in results.multi_face_landmarks:
-                    h, w, c = image.shape
-                    
-                    def get_coords(idx):
-                        lm = face_landmarks.landmark[idx]
-                        return np.array([lm.x * w, lm.y * h])
+                if h is None:
+                    # Frame size is fixed for the video: take the upright (post-rotation) size
+                    # and the inference size once
+                    h, w = image.shape[:2]
+                    if rotate:
+                        h, w = w, h
+                    if w > INFERENCE_WIDTH:
+                        small_size = (INFERENCE_WIDTH, max(1, round(h * INFERENCE_WIDTH / w)))
+                        if rotate:
+                            small_size = small_size[::-1] # resized before it is rotated
                     
-                    # Landmarks
-                    # 13: Inner Upper Lip, 14: Inner Lower Lip
-                    # 10: Forehead Top, 152: Chin Bottom
+                # Downscale to INFERENCE_WIDTH before inference: Face Mesh resizes to its
+                # 192/256 px model inputs anyway, so full-HD frames only cost bandwidth.
+                # Landmarks are normalized, so they are scaled back by the original w, h.
+                if small_size is not None:
+                    small_buf = cv2.resize(image, small_size, small_buf, interpolation=cv2.INTER_AREA)
+                    image = small_buf
                     
-                    upper = get_coords(13)
-                    lower = get_coords(14)
-                    forehead = get_coords(10)
-                    chin = get_coords(152)
+                # Rotation Correction (Simple 90 deg clockwise if requested)
+                # (after the downscale, so only the small frame is copied)
+                if rotate:
+                    rotated_buf = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE, rotated_buf)
+                    image = rotated_buf
                     
-                    # Vertical Opening
-                    vertical_dist = np.linalg.norm(upper - lower)
-                    
-                    # Face Height (Normalization Base)
-                    face_height = np.linalg.norm(forehead - chin)
-                    
-                    # Normalized Openness (%)
-                    # 0% = Closed
-                    # 10% = Moderate
-                    # 30%+ = Wide Open (Screaming/Singing High Note)
-                    openness = (vertical_dist / (face_height + 1e-6)) * 100
-                    
-                    # Capture Max Opening Frame
-                    if openness > max_openness:
-                        max_openness = openness
-                        max_frame_rgb = image_rgb.copy()
-                    
-                    data.append({
-                        "time": timestamp,
-                        "vertical_opening": vertical_dist,
-                        "face_height": face_height,
-                        "openness": openness
-                    })
-            
-            frame_count += 1
-            
-        cap.release()
+                # Convert BGR to RGB
+                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, image_rgb)
+                free.put(frame)
+                results = self.face_mesh.process(image_rgb)
+                
+                timestamp = frame_count * inv_fps
+                
+                if results.multi_face_landmarks:
+                    for face_landmarks in results.multi_face_landmarks:
+                        landmark = face_landmarks.landmark
+                        
+                        # Landmarks
+                        # 13: Inner Upper Lip, 14: Inner Lower Lip
+                        # 10: Forehead Top, 152: Chin Bottom
+                        
+                        upper = landmark[13]
+                        lower = landmark[14]
+                        forehead = landmark[10]
+                        chin = landmark[152]
+                        
+                        # Pixel-space distances on plain floats (2-vectors don't need ndarrays)
+                        # Vertical Opening
+                        vertical_dist = math.hypot((upper.x - lower.x) * w, (upper.y - lower.y) * h)
+                        
+                        # Face Height (Normalization Base)
+                        face_height = math.hypot((forehead.x - chin.x) * w, (forehead.y - chin.y) * h)
+                        
+                        # Normalized Openness (%)
+                        # 0% = Closed
+                        # 10% = Moderate
+                        # 30%+ = Wide Open (Screaming/Singing High Note)
+                        openness = (vertical_dist / (face_height + 1e-6)) * 100
+                        
+                        # Capture Max Opening Frame
+                        # (buffer swap, no copy: the current RGB buffer becomes the thumbnail and
+                        # the previous thumbnail's buffer is what the next frame converts into)
+                        if openness > max_openness:
+                            max_openness = openness
+                            max_frame_rgb, image_rgb = image_rgb, max_frame_rgb
+                        
+                        columns["time"].append(timestamp)
+                        columns["vertical_opening"].append(vertical_dist)
+                        columns["face_height"].append(face_height)
+                        columns["openness"].append(openness)
+        finally:
+            # Stop the reader (on error too): hand back buffers until it posts its end marker
+            stop.set()
+            while item is not None:
+                if item:
+                    free.put(item[1])
+                item = frames.get()
+            reader.join()
+            cap.release()
         
-        if not data:
+        if not columns["time"]:
             return None, None
             
-        return pd.DataFrame(data), max_frame_rgb
+        # dict-of-arrays: each column is one contiguous float32 buffer, no per-row inference
+        # (copy=False: the fresh arrays become the column storage instead of being copied again)
+        df = pd.DataFrame({name: np.asarray(values, dtype=np.float32) for name, values in columns.items()},
+                          copy=False)
+        return df, max_frame_rgb
 
-    def generate_tension_chart(self, df):
+    @staticmethod
+    def generate_tension_chart(df):
         import plotly.express as px
         if df.empty:
             return None